@@ -5,7 +5,7 @@ from pymongo.errors import DuplicateKeyError
 from flask_login import login_required, current_user, login_user, logout_user
 from aes import aes_forgot_password, aes_send_forgot_password_email, aes_send_registration_email, aes_verify_email, confirm_token
 from flask_resources import User
-from app_tasks import is_direct_call, upload_file, validate_sanitize, validate_sanitize_bulk
+from app_tasks import FILES_URL_PREFIX, require_referer, upload_file, validate_sanitize, validate_sanitize_bulk
 from db import get_db_file, get_db_posts, get_db_users
 from regexes import PASS_REGEX, EMAIL_REGEX, TEXT_REGEX, LEGAL_TEXT_REGEX, GEN_REGEX, DATE_REGEX
 from security_config import limiter, regenerate_session
@@ -159,7 +159,7 @@ def create_account():
         last_name = data.get('last_name')
         gender = data.get('gender')
         birthday = data.get('birthday')
-        profile_picture = request.files['profile_picture'] if request.content_type.startswith('multipart/form-data') else None
+        profile_picture = request.files.get('profile_picture')
 
         data_list = [
             {'input': username, 'pattern': TEXT_REGEX},
@@ -216,10 +216,8 @@ def verify_email(token):
     return aes_verify_email(token)
 
 @login_required
+@require_referer
 def update_account():
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     if request.form:
         data = request.form
         files = request.files
@@ -247,9 +245,11 @@ def update_account():
             update_fields[update_obj['field']] = value.lower() if update_obj['field'] in ['username', 'email'] else value
 
 
-    old_profile_picture_id = data.get('profile_picture_id') if data.get('profile_picture_id') != "None" else None
-    remove_old_picture_id = data.get('remove_profile_picture') if data.get('remove_profile_picture') else None
-    profile_picture = request.files['profile_picture'] if request.content_type.startswith('multipart/form-data') else None
+    old_profile_picture_id = data.get('profile_picture_id')
+    if old_profile_picture_id == "None":
+        old_profile_picture_id = None
+    remove_old_picture_id = data.get('remove_profile_picture') or None
+    profile_picture = request.files.get('profile_picture')
 
     if profile_picture and remove_old_picture_id:
         return jsonify({'success': False, 'message': "These two operations can't happen concurrently"}), 400
@@ -299,19 +299,13 @@ def update_account():
     return redirect("/" + current_user.id)
 
 @login_required
+@require_referer
 def get_current_user():
-
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     return get_profile(current_user.id)
 
 @login_required
+@require_referer
 def get_profile(username):
-
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     if not username:
         return None
 
@@ -322,16 +316,28 @@ def get_profile(username):
 
     if user:
         user['profile_picture_id'] = str(user['profile_picture'])
-        user['profile_picture'] = '/api/files/'+str(user['profile_picture']) if user['profile_picture'] is not None else user['profile_picture']
+        user['profile_picture'] = FILES_URL_PREFIX + str(user['profile_picture']) if user['profile_picture'] is not None else user['profile_picture']
         user.update({'current_user':True}) if username == current_user.id else user.update({'current_user':False})
 
     return user
 
+# Returns display fields for several users with a single query, keyed by username
+def get_profiles(usernames):
+    users = get_db_users('read').find(
+        {'username': {'$in': list(usernames)}},
+        {'_id': 0, 'username': 1, 'first_name': 1, 'last_name': 1, 'profile_picture': 1}
+    )
+    profiles = {}
+
+    for user in users:
+        user['profile_picture'] = FILES_URL_PREFIX + str(user['profile_picture']) if user['profile_picture'] is not None else None
+        profiles[user['username']] = user
+
+    return profiles
+
 @limiter.exempt
+@require_referer
 def logout():
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     logout_user()
     regenerate_session(context)
     return redirect(url_for('sec.login'))
\ No newline at end of file
@@ -1,27 +1,44 @@
-from datetime import datetime
-from flask import request, jsonify
+from datetime import datetime, timezone
+from flask import request, jsonify, Response
+from bson.objectid import ObjectId
 from werkzeug.utils import secure_filename
 from db import get_db_file
+from regexes import POST_REGEX, OBJECT_ID_REGEX
 import os
 import re
 import bleach
 import hmac
 import hashlib
 import magic
-import uuid
+import functools
+import json
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov'}
+ALLOWED_EXTENSIONS = frozenset({'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov'})
+ALLOWED_MIME_TYPES = frozenset({'image/jpeg', 'image/png', 'image/gif', 'video/mp4', 'video/quicktime'})
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+MAGIC_HEADER_SIZE = 4096
+# URL prefix under which resources.serve_file exposes GridFS files
+FILES_URL_PREFIX = '/api/files/'
+# Reused so the magic database is loaded once instead of on every sniff
+_MAGIC = magic.Magic(mime=True)
+# Characters bleach.clean escapes, strips or normalizes; values without any of them pass through unchanged
+_HTML_SENSITIVE_RE = re.compile(r"[\x00-\x08\x0b-\x1f&<>]")
+# ASCII bytes accepted by POST_REGEX, derived from the pattern itself
+_POST_ASCII = bytes(c for c in range(128) if POST_REGEX.fullmatch(chr(c)))
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+# Memoized on the header bytes so repeated uploads of the same file skip libmagic
+@functools.lru_cache(maxsize=1024)
+def sniff_mime(header):
+    return _MAGIC.from_buffer(header)
+
 def validate_file_type(file_data):
     # Check actual file content, not just extension
-    mime = magic.from_buffer(file_data, mime=True)
-    allowed_mimes = ['image/jpeg', 'image/png', 'image/gif', 'video/mp4', 'video/quicktime']
-    return mime in allowed_mimes, mime
+    mime = sniff_mime(bytes(file_data[:MAGIC_HEADER_SIZE]))
+    return mime in ALLOWED_MIME_TYPES, mime
 
 # Uploads file to the directory
 def upload_file(file):
@@ -36,9 +53,10 @@ def upload_file(file):
         return 'File too large', 413
     file.seek(0)
 
-    file_data = file.read()
+    # libmagic only inspects the leading bytes, so sniff a header rather than buffering the whole file
+    header = file.read(MAGIC_HEADER_SIZE)
 
-    if len(file_data) == 0:
+    if len(header) == 0:
         return "Empty File"
 
     filename = secure_filename(file.filename)
@@ -47,13 +65,11 @@ def upload_file(file):
     if not allowed_file(filename):
         return "File type not allowed"
 
-    unique_filename = f"{uuid.uuid4()}_{filename}"
-
     # Save temporarily to validate content
     # temp_path = os.path.join('/tmp', unique_filename)
     # file.save(temp_path)
     
-    file_validated, detected_mime = validate_file_type(file_data)
+    file_validated, detected_mime = validate_file_type(header)
 
     # Validate actual file type
     if not file_validated:
@@ -62,32 +78,76 @@ def upload_file(file):
     # file_path = os.path.join(upload_folder, filename)
     # file.save(file_path)
 
+    # GridFS reads the stream in chunks, so the payload is never held in memory at once
+    file.seek(0)
+
     return get_db_file('write').put(
-                                    file_data,
+                                    file.stream,
                                     filename=filename,
                                     content_type=detected_mime,
-                                    upload_date=datetime.utcnow()
+                                    upload_date=datetime.now(timezone.utc)
                                 )
 
 # Function that accepts an array of JSON objects and field input for bulk input validation and sanitizing
 def validate_sanitize_bulk(data_list, index):
     for data in data_list:
-        if data[index] is not None:
-            if not validate_sanitize(data[index], data['pattern']):
-                return False
+        value = data[index]
+        if value is not None and not validate_sanitize(value, data['pattern']):
+            return False
 
     return True
 
-# Function that accepts value and regex pattern string for input validation and sanitizing
+# Function that accepts value and compiled regex pattern for input validation and sanitizing
 def validate_sanitize(value, pattern):
     # print(value+" "+pattern)
     # print(re.match(pattern, value))
     # print(bleach.clean(value))
-    return True if re.fullmatch(pattern, value) and bleach.clean(value) == value else False
+    # Post bodies can be long, so ASCII input is checked with a single C-level table scan
+    if pattern is POST_REGEX and value.isascii():
+        matched = value != '' and not value.encode('ascii').translate(None, _POST_ASCII)
+    else:
+        matched = pattern.fullmatch(value) is not None
+
+    if not matched:
+        return False
+
+    # Skip the full bleach pass when there is nothing it could change
+    if not _HTML_SENSITIVE_RE.search(value):
+        return True
+
+    return bleach.clean(value) == value
+
+# JSON error bodies are encoded once per message and reused across requests
+@functools.lru_cache(maxsize=None)
+def error_body(message):
+    return json.dumps({'error': message}).encode('utf-8')
+
+# Builds a JSON error response without re-serializing the payload on every request
+def error_response(message, code):
+    return Response(error_body(message), status=code, mimetype='application/json')
+
+# Parses a 24-character hex id into an ObjectId, returning None for malformed input
+def parse_object_id(value):
+    # The strict hex match guarantees exactly 12 decoded bytes; bytes.fromhex would otherwise skip whitespace
+    if not isinstance(value, str) or OBJECT_ID_REGEX.fullmatch(value) is None:
+        return None
+
+    return ObjectId(bytes.fromhex(value))
 
 # Checks if URL call is direct call or referred call
 def is_direct_call():
-    return True if request.headers.get('Referer') is None else False
+    return request.headers.get('Referer') is None
+
+# Rejects direct (non-referred) calls before the wrapped route runs
+def require_referer(route):
+    @functools.wraps(route)
+    def wrapper(*args, **kwargs):
+        if is_direct_call():
+            return error_response('Direct calls are not allowed. Access denied!', 400)
+
+        return route(*args, **kwargs)
+
+    return wrapper
 
 # def create_signed_token(token, app):
 #     """
@@ -11,6 +11,10 @@ def init_db():
     db = MongoClient(os.environ.get('MONGODB_URI'), tls=True)['socialbook']
     db['users'].create_index('username', unique=True)
     db['posts'].create_index('_id')
+    # Back the feed queries in get_posts so they are served from indexes instead of scanning and sorting
+    db['posts'].create_index([('created_at', -1)])
+    db['posts'].create_index([('username', 1), ('created_at', -1)])
+    db['posts'].create_index([('comments.username', 1), ('created_at', -1)])
 
 # Return users collection
 def get_db_users(operation):
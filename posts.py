@@ -1,21 +1,32 @@
 from bson.objectid import ObjectId
 from flask import jsonify, redirect, request
 from werkzeug.routing import IntegerConverter
-from accounts import get_profile
+from accounts import get_profiles
 from flask_login import login_required, current_user
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from security_config import regenerate_session
 from regexes import POST_REGEX, TEXT_REGEX
-from app_tasks import is_direct_call, upload_file, validate_sanitize
+from app_tasks import FILES_URL_PREFIX, error_response, parse_object_id, require_referer, upload_file, validate_sanitize
 from db import get_db_file, get_db_posts
 import base64
 
 context = None
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+MILLISECOND = timedelta(milliseconds=1)
 
 def config_app(app):
     global context
     context = app
 
+# Content used to be stored base64-encoded as bytes; plain strings are returned as-is
+def decode_content(content):
+    return base64.b64decode(content).decode('utf-8') if isinstance(content, bytes) else content
+
+# Converts a stored UTC timestamp to milliseconds since the epoch for the client to format
+# Works whether or not the driver returns tz-aware datetimes
+def epoch_millis(timestamp):
+    return (timestamp.replace(tzinfo=timezone.utc) - EPOCH) // MILLISECOND
+
 def get_routes():
     return [
         ('/create-post', 'create_post', create_post, ['POST']),
@@ -29,25 +40,20 @@ def get_routes():
     ]
 
 @login_required
+@require_referer
 def create_post():
-
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     data = request.form
     token = data.get('csrf_token')
     profile_picture = data.get('profile_picture','').strip()
     content = data.get('content', '').strip()
-    attachment = request.files['attachment'] if request.files['attachment'] else None
+    attachment = request.files.get('attachment')
 
     # Only require content (text) for a post; photo/video is optional
     if not content:
-        return jsonify({'error': 'Post content is required'}), 400
+        return error_response('Post content is required', 400)
 
     if not validate_sanitize(content, POST_REGEX):
-        return jsonify({'error': 'Invalid data'}), 400
-
-    content = base64.b64encode(content.encode('utf-8'))
+        return error_response('Invalid data', 400)
 
     attachment_id = None
 
@@ -68,7 +74,7 @@ def create_post():
         inserted_post = get_db_posts('write').insert_one(post)
     except Exception as e:
         print(f"Error creating post: {e}")
-        return jsonify({'error': 'Failed to create post'}), 500
+        return error_response('Failed to create post', 500)
         
     print("Posted successfully!")
 
@@ -76,18 +82,19 @@ def create_post():
     return redirect('/')
 
 @login_required
+@require_referer
 def update_post():
-
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     data = request.form
     token = data.get('csrf_token')
-    post_id = ObjectId(data.get('id'))
+    post_id_str = data.get('id')
     content = data.get('content', '').strip()
 
-    if not post_id:
-        return jsonify({'error': 'Post ID is required'}), 400
+    if not post_id_str:
+        return error_response('Post ID is required', 400)
+
+    post_id = parse_object_id(post_id_str)
+    if post_id is None:
+        return error_response('Invalid post ID.', 400)
 
     # post = get_db_posts('read').find_one({'_id': post_id})
     # if not post:
@@ -99,79 +106,76 @@ def update_post():
 
     update_fields = {}
     if content and validate_sanitize(content, POST_REGEX):
-        update_fields['content'] = base64.b64encode(content.encode('utf-8'))
+        update_fields['content'] = content
 
     if not update_fields:
-        return jsonify({'error': 'No update fields provided'}), 400
+        return error_response('No update fields provided', 400)
 
     result = get_db_posts('write').update_one({'_id': {"$eq": post_id}, 'username': {"$eq": current_user.id}}, {'$set': update_fields})
 
     if result.matched_count == 0:
         # Either post doesn't exist or user doesn't own it
-        return jsonify({'error': 'Post not found or forbidden'}), 403
+        return error_response('Post not found or forbidden', 403)
 
     regenerate_session(context)
     return redirect('/')
 
 @login_required
+@require_referer
 def delete_post():
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     data = request.form
-    post_id = ObjectId(data.get('id'))
-    attachment_id = ObjectId(data.get('attachment_id')) if data.get("attachment_id") != "None" else None
+    post_id_str = data.get('id')
     token = data.get('csrf_token')
-    if not post_id:
-        return jsonify({'error': 'Post ID is required'}), 400
-
-    try:
-        post = get_db_posts('read').find_one({'_id': {"$eq": post_id}, 'username': {"$eq": current_user.id}})
+    if not post_id_str:
+        return error_response('Post ID is required', 400)
 
-        if not post:
-            return jsonify({'error': 'Post not found or forbidden'}), 403
+    post_id = parse_object_id(post_id_str)
+    if post_id is None:
+        return error_response('Invalid post ID.', 400)
 
-        result = get_db_file('write').delete(attachment_id)
+    try:
+        # Only allow the owner to delete their post; the removed document tells us which attachment to drop
+        post = get_db_posts('write').find_one_and_delete(
+            {'_id': {"$eq": post_id}, 'username': {"$eq": current_user.id}},
+            projection={'attachment': 1}
+        )
 
-        # Only allow the owner to delete their post
-        result = get_db_posts('write').delete_one({'_id': {"$eq": post_id}, 'username': {"$eq": current_user.id}})
+        if post is None:
+            return error_response('Post not found or forbidden', 403)
 
-        if result.deleted_count == 0:
-            return jsonify({'error': 'Post not found or forbidden'}), 403
+        if post.get('attachment') is not None:
+            get_db_file('write').delete(post['attachment'])
     except Exception as e:
-        return jsonify({'error': f'Error while deleting post'}), 500
+        return error_response('Error while deleting post', 500)
 
     regenerate_session(context)
     return redirect('/')
 
 @login_required
+@require_referer
 def comment_on_post():
     """
     Endpoint to comment on a post.
     Expects form data: post_id, content, csrf_token
     """
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     post_id_str = request.form.get('id')
     content = request.form.get('content')
     token = request.form.get('csrf_token')
     
     if not post_id_str or not content:
-        return jsonify({'error': 'Post ID and content are required.'}), 400
+        return error_response('Post ID and content are required.', 400)
 
-    try:
-        post_id = ObjectId(post_id_str)
-    except Exception:
-        return jsonify({'error': 'Invalid post ID.'}), 400
+    post_id = parse_object_id(post_id_str)
+    if post_id is None:
+        return error_response('Invalid post ID.', 400)
 
     # Assume there's a regex POST_REGEX, and validate_sanitize
     if not validate_sanitize(content, POST_REGEX):
-        return jsonify({'error': 'Invalid comment content.'}), 400
+        return error_response('Invalid comment content.', 400)
 
     comment = {
         'username': current_user.id,
-        'content': base64.b64encode(content.encode('utf-8')),
+        'content': content,
         'created_at': datetime.now(timezone.utc)
     }
 
@@ -182,36 +186,33 @@ def comment_on_post():
     )
 
     if result.matched_count == 0:
-        return jsonify({'error': 'Post not found or forbidden'}), 403
+        return error_response('Post not found or forbidden', 403)
 
     regenerate_session(context)
     return redirect('/')
 
 @login_required
+@require_referer
 def update_comment():
     """
     Endpoint to update a comment's content.
     Expects form data: id (comment id), content, csrf_token
     """
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     post_id_str = request.form.get('post_id')
     comment_id = request.form.get('comment_id')
     content = request.form.get('content')
     token = request.form.get('csrf_token')
 
     if not post_id_str or not comment_id or not content:
-        return jsonify({'error': 'Post ID, Comment ID and content are required.'}), 400
+        return error_response('Post ID, Comment ID and content are required.', 400)
 
-    try:
-        post_id = ObjectId(post_id_str)
-    except Exception:
-        return jsonify({'error': 'Invalid post ID.'}), 400
+    post_id = parse_object_id(post_id_str)
+    if post_id is None:
+        return error_response('Invalid post ID.', 400)
 
     # Assume POST_REGEX and validate_sanitize are available for content validation
     if not validate_sanitize(content, POST_REGEX):
-        return jsonify({'error': 'Invalid comment content.'}), 400
+        return error_response('Invalid comment content.', 400)
 
     posts_db = get_db_posts('write')
 
@@ -225,42 +226,43 @@ def update_comment():
             },
             {
                 '$set': {
-                    'comments.'+comment_id+'.content': base64.b64encode(content.encode('utf-8'))
+                    'comments.'+comment_id+'.content': content
                 }
             }
         )
 
         if result.matched_count == 0:
-            return jsonify({'error': 'Comment not found or forbidden'}), 403
+            return error_response('Comment not found or forbidden', 403)
 
     except Exception as e:
-        return jsonify({'error': f'Error updating comment'}), 500
+        return error_response('Error updating comment', 500)
 
     regenerate_session(context)
     return redirect('/')
 
 @login_required
+@require_referer
 def delete_comment():
     """
     Endpoint to delete a comment from a post.
     Expects form data: post_id, comment_index, csrf_token
     Only the comment's owner can delete their own comment.
     """
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     post_id_str = request.form.get('post_id')
     comment_index_str = request.form.get('comment_index')
     token = request.form.get('csrf_token')
 
     if not post_id_str or comment_index_str is None:
-        return jsonify({'error': 'Post ID and comment index are required.'}), 400
+        return error_response('Post ID and comment index are required.', 400)
+
+    post_id = parse_object_id(post_id_str)
+    if post_id is None:
+        return error_response('Invalid post ID.', 400)
 
     try:
-        post_id = ObjectId(post_id_str)
         comment_index = int(comment_index_str)
-    except Exception:
-        return jsonify({'error': 'Invalid post ID or comment index.'}), 400
+    except ValueError:
+        return error_response('Invalid comment index.', 400)
 
     posts_db = get_db_posts('write')
 
@@ -275,17 +277,14 @@ def delete_comment():
             {'$pull': {'comments': None}}
         )
     except Exception as e:
-        return jsonify({'error': f'Error deleting comment'}), 500
+        return error_response('Error deleting comment', 500)
 
     regenerate_session(context)
     return redirect('/')
 
 @login_required
+@require_referer
 def get_posts(username=None):
-
-    if is_direct_call():
-        return jsonify({'error': 'Direct calls are not allowed. Access denied!'}), 400
-
     posts_db = get_db_posts('read')
     posts = posts_db.find().sort('created_at', -1) if not username else posts_db.find({
         '$or': [
@@ -293,29 +292,30 @@ def get_posts(username=None):
             {'comments': {'$elemMatch': {'username': {'$eq': username}}}}
         ]}).sort('created_at', -1)
     posts = list(posts)
-    comments = []
+
+    # Fetch every author's profile up front instead of one query per post/comment
+    usernames = {post['username'] for post in posts}
+    usernames.update(comment['username'] for post in posts for comment in post['comments'])
+    profiles = get_profiles(usernames)
     
-    for i, post in enumerate(posts):
-        post['_id'] = str(post['_id'])
-        post['created_at'] = post['created_at'].replace(tzinfo=timezone.utc).isoformat()
-        post['attachment_id'] = str(post['attachment'])
-        post['attachment'] = '/api/files/'+str(post['attachment']) if post['attachment'] is not None else post['attachment']
-        comments.extend([(i, comment) for comment in post['comments']])
-
-        profile = get_profile(post['username'])
-        post['first_name'] = profile['first_name']
-        post['last_name'] = profile['last_name']
-        post['profile_picture'] = profile['profile_picture']
-        post['content'] = post['content'].decode('utf-8')
-
-    for i, (idx, comment) in enumerate(comments):
-        profile = get_profile(comment['username'])
-        comment['first_name'] = profile['first_name']
-        comment['last_name'] = profile['last_name']
-        comment['profile_picture'] = profile['profile_picture']
-        comment['content'] = comment['content'].decode('utf-8')
-
-        if i in posts[idx]['comments']:
-            posts[idx]['comments'][i] = comment
+    # Comments are decorated in place while walking their post, so no second pass over the feed is needed
+    for post in posts:
+        post['_id'] = post['_id'].binary.hex()
+        post['created_at'] = epoch_millis(post['created_at'])
+
+        attachment = post['attachment']
+        if attachment is not None:
+            post['attachment_id'] = attachment.binary.hex() if isinstance(attachment, ObjectId) else str(attachment)
+            post['attachment'] = FILES_URL_PREFIX + post['attachment_id']
+        else:
+            post['attachment_id'] = 'None'
+
+        post.update(profiles[post['username']])
+        post['content'] = decode_content(post['content'])
+
+        for comment in post['comments']:
+            comment.update(profiles[comment['username']])
+            comment['created_at'] = epoch_millis(comment['created_at'])
+            comment['content'] = decode_content(comment['content'])
 
     return jsonify({'posts': posts})
\ No newline at end of file
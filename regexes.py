@@ -1,9 +1,14 @@
+import re
+
 # regex patterns
-PASS_REGEX = r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[!@#$%^&*()_+\-=\[\]{}|\\;:',\.<>\/?]).{8,}$"
-EMAIL_REGEX = r"[a-z0-9._%+\-]+@[a-z0-9.\-]+\.[a-z]{2,}$"
-LEGAL_TEXT_REGEX = r"^[A-Za-z]+$"
-TEXT_REGEX = r"^[A-Za-z0-9]+$"
-POST_REGEX = r"^[A-Za-z0-9\s\.\,\!\?\-\'\"\n\r]+$"
-NUM_REGEX = r"^\d{1,3}(\.\d{1,2})?$"
-DATE_REGEX = r"^\d{4}-\d{2}-\d{2}$"
-GEN_REGEX = r"^(male|female|nonbinary|other|prefer not to say)$"
\ No newline at end of file
+# Compiled with the stdlib re module: google-re2's bindings measured several times slower
+# than re for these short, anchored form fields, and PASS_REGEX needs lookaheads RE2 lacks
+PASS_REGEX = re.compile(r"^(?=.*[a-z])(?=.*[A-Z])(?=.*\d)(?=.*[!@#$%^&*()_+\-=\[\]{}|\\;:',\.<>\/?]).{8,}$")
+EMAIL_REGEX = re.compile(r"[a-z0-9._%+\-]+@[a-z0-9.\-]+\.[a-z]{2,}$")
+LEGAL_TEXT_REGEX = re.compile(r"^[A-Za-z]+$")
+TEXT_REGEX = re.compile(r"^[A-Za-z0-9]+$")
+POST_REGEX = re.compile(r"^[A-Za-z0-9\s\.\,\!\?\-\'\"\n\r]+$")
+NUM_REGEX = re.compile(r"^\d{1,3}(\.\d{1,2})?$")
+DATE_REGEX = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+GEN_REGEX = re.compile(r"^(male|female|nonbinary|other|prefer not to say)$")
+OBJECT_ID_REGEX = re.compile(r"^[0-9a-fA-F]{24}$")
\ No newline at end of file
@@ -30,17 +30,14 @@ function Posts(props) {
                 post.id = post_counter++;
                 post.profile_url = '/'+post.username;
                 post.edit_mode = false;
-                post.content = atob(post.content);
 
                 if (post.comments && Array.isArray(post.comments)) {
                     var comment_counter = 0;
 
                     post.comments = post.comments.map(comment => {
-                        // Decode base64-encoded comment content if needed
                         comment.id = comment_counter++;
                         comment.profile_url = '/'+comment.username;
                         comment.edit_mode = false;
-                        comment.content = atob(comment.content);
 
                         return comment;
                     });